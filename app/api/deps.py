@@ -1,14 +1,14 @@
+from dataclasses import dataclass
 from typing import Generator
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
+from jose import JWTError
 from sqlalchemy.orm import Session
 
-from app.db import models, crud
+from app.db import crud
 from app.db.database import SessionLocal
 from app.core import security
-from app.core.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="/api/auth/token"
@@ -21,24 +21,39 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> models.User:
-    credentials_exception = HTTPException(
+@dataclass(frozen=True)
+class TokenUser:
+    """Identity carried by a verified access token; no database round trip needed."""
+
+    id: int
+    email: str
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def get_token_user(
+    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> TokenUser:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
+        payload = security.decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Tokens issued before user ids were embedded still need the email lookup
+        user = crud.get_user_by_email(db, email=email)
+        if user is None:
+            raise _credentials_exception()
+        user_id = user.id
+    return TokenUser(id=user_id, email=email)
+
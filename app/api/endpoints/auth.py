@@ -4,7 +4,7 @@ from urllib.parse import urlencode
 import httpx
 from fastapi import APIRouter, Depends, Form, HTTPException, status
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from jose import JWTError
 
 from app.db import crud
 from app.api import deps
@@ -96,8 +96,8 @@ def register_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
-    crud.create_user(db=db, email=form_data.email, password=form_data.password)
-    access_token = create_access_token(subject=form_data.email)
+    user = crud.create_user(db=db, email=form_data.email, password=form_data.password)
+    access_token = create_access_token(subject=user.email, user_id=user.id)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -115,7 +115,7 @@ def login_for_access_token(
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(subject=user.email)
+    access_token = create_access_token(subject=user.email, user_id=user.id)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -143,9 +143,7 @@ def github_callback(code: str, state: str, db: Session = Depends(deps.get_db)):
     _ensure_github_oauth_configured()
 
     try:
-        payload = jwt.decode(
-            state, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
+        payload = security.decode_access_token(state)
         if payload.get("sub") != "github_oauth":
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -188,5 +186,5 @@ def github_callback(code: str, state: str, db: Session = Depends(deps.get_db)):
     if not user:
         user = crud.create_user(db=db, email=email, password=None)
 
-    access_token = create_access_token(subject=user.email)
+    access_token = create_access_token(subject=user.email, user_id=user.id)
     return {"access_token": access_token, "token_type": "bearer"}
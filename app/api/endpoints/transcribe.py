@@ -1,38 +1,94 @@
-import shutil
+import hashlib
+import logging
 import uuid
 from pathlib import Path
+from typing import Optional
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Response, status
+from fastapi import APIRouter, Depends, Header, UploadFile, File, Form, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.db import crud, models
 from app.api import deps
+from app.core import admission, transcripts
 from app.core.config import settings
-from app.worker.tasks import transcribe_task, health_check
+from app.worker.tasks import detect_language_task, transcribe_task, health_check
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _rejected(exc: admission.AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=exc.status_code,
+        detail=exc.detail,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as If-None-Match requires (RFC 9110): W/ is ignored, * matches."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
 
 @router.post("/transcribe")
 def create_transcription_task(
     language: str = Form(...),
     file: UploadFile = File(...),
     db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
+    current_user: deps.TokenUser = Depends(deps.get_token_user),
 ):
+    try:
+        admission.check_rate_limit(current_user.id)
+    except admission.AdmissionRejected as exc:
+        raise _rejected(exc) from exc
+
     task_id = str(uuid.uuid4())
     
     # Save the uploaded file temporarily
     upload_dir = Path(settings.UPLOAD_DIR)
     upload_dir.mkdir(parents=True, exist_ok=True)
     file_path = upload_dir / f"{task_id}_{file.filename}"
+    audio_hash = hashlib.sha256()
     with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+            audio_hash.update(chunk)
+            buffer.write(chunk)
 
-    crud.create_task(db, task_id, current_user.id)
+    try:
+        admitted = admission.admit(task_id, admission.estimate_audio_seconds(file_path))
+    except admission.AdmissionRejected as exc:
+        file_path.unlink(missing_ok=True)
+        raise _rejected(exc) from exc
+
+    # The user already submitted this exact audio, so report its language right away
+    cached = crud.get_cached_language(db, current_user.id, audio_hash.hexdigest())
+    crud.create_task(
+        db,
+        task_id,
+        current_user.id,
+        audio_hash=audio_hash.hexdigest(),
+        detected_language=cached.detected_language if cached else None,
+        language_confidence=cached.language_confidence if cached else None,
+    )
+
+    if not cached:
+        try:
+            detect_language_task.delay(task_id, str(file_path))
+        except Exception:
+            # Transcription still works without early detection
+            logger.exception("Could not enqueue language detection for task %s", task_id)
     
     try:
         transcribe_task.delay(task_id, language, str(file_path))
     except Exception as exc:
+        admission.release(task_id)
         crud.update_task_status(db, task_id, models.TaskStatus.FAILURE, result=str(exc))
         file_path.unlink(missing_ok=True)
         raise HTTPException(
@@ -40,14 +96,18 @@ def create_transcription_task(
             detail="Could not enqueue transcription task",
         ) from exc
 
-    return {"task_id": task_id}
+    return {
+        "task_id": task_id,
+        "queue_depth": admitted.queue_depth,
+        "estimated_completion_at": admitted.estimated_completion_at,
+    }
 
 
 @router.get("/status/{task_id}")
 def get_transcription_status(
     task_id: str,
     db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
+    current_user: deps.TokenUser = Depends(deps.get_token_user),
 ):
     task = crud.get_task(db, task_id)
     if not task:
@@ -56,12 +116,18 @@ def get_transcription_status(
     if task.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this task")
 
-    return {"id": task.id, "status": task.status, "result": task.result}
+    return {
+        "id": task.id,
+        "status": task.status,
+        "result": task.result,
+        "detected_language": task.detected_language,
+        "language_confidence": task.language_confidence,
+    }
 
 @router.get("/tasks")
 def list_user_tasks(
     db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
+    current_user: deps.TokenUser = Depends(deps.get_token_user),
 ):
     tasks = crud.get_tasks_for_user(db, current_user.id)
     return [
@@ -75,11 +141,82 @@ def list_user_tasks(
     ]
 
 
+@router.get("/tasks/search")
+def search_user_tasks(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(deps.get_db),
+    current_user: deps.TokenUser = Depends(deps.get_token_user),
+):
+    matches = crud.search_tasks(db, current_user.id, q, limit=limit, offset=offset)
+    total = crud.count_search_results(db, current_user.id, q)
+    return {
+        "items": [
+            {
+                "id": match["id"],
+                "status": match["status"],
+                "snippet": match["snippet"],
+                "created_at": match["created_at"],
+            }
+            for match in matches
+        ],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "has_more": offset + len(matches) < total,
+    }
+
+
+@router.get("/tasks/{task_id}/transcript")
+def get_task_transcript(
+    task_id: str,
+    format: str = Query("txt", pattern="^(srt|vtt|json|txt)$"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(deps.get_db),
+    current_user: deps.TokenUser = Depends(deps.get_token_user),
+):
+    task = crud.get_task(db, task_id)
+    if not task:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+
+    if task.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this task")
+
+    if task.status != models.TaskStatus.SUCCESS:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Transcript is not ready")
+
+    if task.segments:
+        segments = transcripts.decode_segments(task.segments)
+    elif format == "txt":
+        # Tasks transcribed before segments were stored only have plain text
+        segments = [(0.0, 0.0, task.result or "")]
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Timestamped segments are not available for this task",
+        )
+
+    digest = hashlib.sha1(f"{format}:{task.segments or task.result}".encode("utf-8")).hexdigest()
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    headers["Content-Disposition"] = f'inline; filename="{task_id}.{format}"'
+    media_type = transcripts.MEDIA_TYPES[format]
+    if format != "json":
+        media_type += "; charset=utf-8"
+    return StreamingResponse(
+        transcripts.render(segments, format), media_type=media_type, headers=headers
+    )
+
+
 @router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_user_task(
     task_id: str,
     db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
+    current_user: deps.TokenUser = Depends(deps.get_token_user),
 ):
     task = crud.get_task(db, task_id)
     if not task:
@@ -0,0 +1,205 @@
+import math
+import time
+import wave
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+
+from app.core.config import settings
+
+# Sorted set of task ids scored by reservation deadline, plus their audio seconds
+RESERVATIONS_KEY = "admission:reservations"
+RESERVED_SECONDS_KEY = "admission:reserved_seconds"
+RATE_LIMIT_KEY_PREFIX = "admission:rate"
+RATE_LIMIT_WINDOW_SECONDS = 60
+
+# Rough bytes-per-second for compressed uploads we cannot parse (~128 kbps)
+FALLBACK_BYTES_PER_SECOND = 16_000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a submission must be turned away; carries the HTTP hint."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, retry_after)
+
+
+@dataclass
+class Admission:
+    audio_seconds: float
+    queue_depth: int
+    backlog_seconds: float
+    estimated_completion_at: datetime
+
+
+@lru_cache()
+def get_redis():
+    """Return a Redis client for admission state, or None when not configured."""
+    if not settings.REDIS_URL:
+        return None
+
+    import redis
+
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=1)
+
+
+@lru_cache()
+def get_broker_redis():
+    """Return a Redis client for the Celery broker, or None if it is not Redis."""
+    from app.worker.celery_app import broker_url
+
+    if not broker_url.startswith(("redis://", "rediss://", "unix://")):
+        return None
+
+    import redis
+
+    return redis.Redis.from_url(broker_url, socket_timeout=1)
+
+
+def _queue_depth() -> int:
+    from app.worker.celery_app import celery_app
+
+    client = get_broker_redis()
+    if client is None:
+        return 0
+    try:
+        return int(client.llen(celery_app.conf.task_default_queue) or 0)
+    except Exception:
+        return 0
+
+
+def estimate_audio_seconds(file_path: Path) -> float:
+    """Read the duration of WAV files exactly; approximate everything else by size."""
+    try:
+        with wave.open(str(file_path), "rb") as audio:
+            return audio.getnframes() / float(audio.getframerate())
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return file_path.stat().st_size / FALLBACK_BYTES_PER_SECOND
+
+
+def _seconds_to_drain(backlog_seconds: float) -> float:
+    return backlog_seconds / settings.WORKER_AUDIO_SECONDS_PER_SECOND
+
+
+def check_rate_limit(user_id: int) -> None:
+    """Fixed-window per-user limit on submissions, shared through Redis."""
+    client = get_redis()
+    if client is None or settings.RATE_LIMIT_PER_MINUTE <= 0:
+        return
+
+    now = time.time()
+    window = int(now // RATE_LIMIT_WINDOW_SECONDS)
+    key = f"{RATE_LIMIT_KEY_PREFIX}:{user_id}:{window}"
+    try:
+        count = client.incr(key)
+        if count == 1:
+            client.expire(key, RATE_LIMIT_WINDOW_SECONDS)
+    except Exception:
+        # Fail open: an unavailable Redis should not take submissions down with it
+        return
+
+    if count > settings.RATE_LIMIT_PER_MINUTE:
+        retry_after = math.ceil((window + 1) * RATE_LIMIT_WINDOW_SECONDS - now)
+        raise AdmissionRejected(429, "Rate limit exceeded", retry_after)
+
+
+def _as_str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _live_reservations(client, pipeline_results) -> float:
+    """Sum reserved audio for ids still in the sorted set and prune orphaned seconds."""
+    live_ids, reserved = pipeline_results
+    live = {_as_str(task_id) for task_id in live_ids}
+    reserved = {_as_str(task_id): float(seconds) for task_id, seconds in reserved.items()}
+    orphaned = [task_id for task_id in reserved if task_id not in live]
+    if orphaned:
+        # Ids are unique, so removing seconds whose deadline already passed is race-free
+        client.hdel(RESERVED_SECONDS_KEY, *orphaned)
+    return sum(seconds for task_id, seconds in reserved.items() if task_id in live)
+
+
+def _reserve(client, task_id: str, audio_seconds: float) -> float:
+    """Record the task's audio, then return the backlog including it.
+
+    Expiry, the reservation and the read run in one MULTI/EXEC, so concurrent
+    submits always see each other and a spike can only over-reject, never
+    over-admit. Reservations carry a deadline so audio from tasks whose worker
+    died is dropped instead of leaking forever.
+    """
+    now = time.time()
+    pipeline = client.pipeline(transaction=True)
+    pipeline.zremrangebyscore(RESERVATIONS_KEY, "-inf", now)
+    pipeline.hset(RESERVED_SECONDS_KEY, task_id, audio_seconds)
+    pipeline.zadd(RESERVATIONS_KEY, {task_id: now + settings.ADMISSION_RESERVATION_TTL_SECONDS})
+    pipeline.zrange(RESERVATIONS_KEY, 0, -1)
+    pipeline.hgetall(RESERVED_SECONDS_KEY)
+    return _live_reservations(client, pipeline.execute()[-2:])
+
+
+def _reserved_backlog(client) -> float:
+    """Read the live backlog without reserving anything."""
+    pipeline = client.pipeline(transaction=True)
+    pipeline.zremrangebyscore(RESERVATIONS_KEY, "-inf", time.time())
+    pipeline.zrange(RESERVATIONS_KEY, 0, -1)
+    pipeline.hgetall(RESERVED_SECONDS_KEY)
+    return _live_reservations(client, pipeline.execute()[-2:])
+
+
+def admit(task_id: str, audio_seconds: float) -> Admission:
+    """Reserve the task's audio in the backlog, rejecting it if the queue is saturated."""
+    client = get_redis()
+    queue_depth = _queue_depth()
+    if settings.ADMISSION_MAX_QUEUE_DEPTH and queue_depth >= settings.ADMISSION_MAX_QUEUE_DEPTH:
+        backlog_seconds = 0.0
+        if client is not None:
+            try:
+                backlog_seconds = _reserved_backlog(client)
+            except Exception:
+                backlog_seconds = 0.0
+        if not backlog_seconds:
+            # No reservation data: assume queued tasks are about as long as this one
+            backlog_seconds = queue_depth * audio_seconds
+        raise AdmissionRejected(
+            503, "Transcription queue is full, try again later", math.ceil(_seconds_to_drain(backlog_seconds))
+        )
+
+    backlog_seconds = audio_seconds
+    if client is not None:
+        try:
+            backlog_seconds = _reserve(client, task_id, audio_seconds)
+        except Exception:
+            backlog_seconds = audio_seconds
+
+    if settings.ADMISSION_MAX_BACKLOG_SECONDS and backlog_seconds > settings.ADMISSION_MAX_BACKLOG_SECONDS:
+        release(task_id)
+        excess = backlog_seconds - settings.ADMISSION_MAX_BACKLOG_SECONDS
+        raise AdmissionRejected(
+            503,
+            "Transcription backlog is too large, try again later",
+            math.ceil(_seconds_to_drain(excess)),
+        )
+
+    eta = datetime.now(timezone.utc) + timedelta(seconds=_seconds_to_drain(backlog_seconds))
+    return Admission(
+        audio_seconds=audio_seconds,
+        queue_depth=queue_depth,
+        backlog_seconds=backlog_seconds - audio_seconds,
+        estimated_completion_at=eta,
+    )
+
+
+def release(task_id: str) -> None:
+    """Remove a finished (or abandoned) task's audio from the shared backlog."""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.zrem(RESERVATIONS_KEY, task_id)
+        client.hdel(RESERVED_SECONDS_KEY, task_id)
+    except Exception:
+        pass
@@ -8,9 +8,26 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     DATABASE_URL: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Comma-separated "kid:secret" pairs accepted for verification; defaults to SECRET_KEY.
+    # Once set, tokens without a kid (signed with SECRET_KEY) are no longer accepted.
+    SIGNING_KEYS: Optional[str] = None
+    # Key id used to sign new tokens; must be present in SIGNING_KEYS when that is set
+    SIGNING_KEY_ID: str = "default"
+    TOKEN_CACHE_SIZE: int = 1024
     UPLOAD_DIR: str = "uploads"
     GITHUB_CLIENT_ID: Optional[str] = None
     GITHUB_CLIENT_SECRET: Optional[str] = None
     GITHUB_REDIRECT_URI: Optional[str] = None
+    # Holds admission state; queue depth is read from the Celery broker (CELERY_BROKER_URL)
+    REDIS_URL: Optional[str] = None
+    # Admission control: 0 disables the corresponding check
+    ADMISSION_MAX_QUEUE_DEPTH: int = 100
+    ADMISSION_MAX_BACKLOG_SECONDS: float = 4 * 60 * 60
+    RATE_LIMIT_PER_MINUTE: int = 10
+    # Reserved audio is forgotten after this long even if its worker never released it;
+    # keep it above the longest expected queue wait
+    ADMISSION_RESERVATION_TTL_SECONDS: int = 6 * 60 * 60
+    # Aggregate worker throughput in seconds of audio transcribed per wall-clock second
+    WORKER_AUDIO_SECONDS_PER_SECOND: float = 1.0
 
 settings = Settings()
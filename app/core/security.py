@@ -1,7 +1,11 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Union
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
 
-from jose import jwt
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
@@ -11,8 +15,61 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 
 
+@lru_cache()
+def get_signing_keys() -> Dict[str, str]:
+    """Map key ids to secrets accepted for verification."""
+    if not settings.SIGNING_KEYS:
+        return {settings.SIGNING_KEY_ID: settings.SECRET_KEY}
+
+    keys = {}
+    for entry in settings.SIGNING_KEYS.split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if not kid or not secret:
+            raise ValueError("SIGNING_KEYS entries must look like 'kid:secret'")
+        keys[kid] = secret
+    if settings.SIGNING_KEY_ID not in keys:
+        raise ValueError(f"SIGNING_KEY_ID {settings.SIGNING_KEY_ID!r} is not in SIGNING_KEYS")
+    return keys
+
+
+class _VerifiedTokenCache:
+    """Small LRU of verified token claims, each kept only until the token expires."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = _VerifiedTokenCache(settings.TOKEN_CACHE_SIZE)
+
+
 def create_access_token(
-    subject: Union[str, Any], expires_delta: timedelta = None
+    subject: Union[str, Any], expires_delta: timedelta = None, user_id: Optional[int] = None
 ) -> str:
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -21,10 +78,46 @@ def create_access_token(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
     to_encode = {"exp": expire, "sub": str(subject)}
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+    if user_id is not None:
+        to_encode["uid"] = user_id
+    kid = settings.SIGNING_KEY_ID
+    encoded_jwt = jwt.encode(
+        to_encode, get_signing_keys()[kid], algorithm=ALGORITHM, headers={"kid": kid}
+    )
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Verify a token against the key named by its kid, serving repeats from cache.
+
+    Raises JWTError when the token is malformed, expired or signed with an unknown key.
+    """
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+
+    kid = jwt.get_unverified_header(token).get("kid")
+    if kid is None:
+        # Tokens issued before key ids were introduced were signed with SECRET_KEY.
+        # Once SIGNING_KEYS is configured SECRET_KEY is retired and they stop verifying.
+        if settings.SIGNING_KEYS:
+            raise JWTError("Token has no key id")
+        key = settings.SECRET_KEY
+    else:
+        key = get_signing_keys().get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+
+    claims = jwt.decode(token, key, algorithms=[ALGORITHM])
+    if "exp" not in claims:
+        raise JWTError("Token has no expiry")
+    if kid is None:
+        # Legacy tokens never carried a user id, so one here was not issued by us
+        claims.pop("uid", None)
+    token_cache.put(token, claims)
+    return claims
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
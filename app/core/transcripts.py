@@ -0,0 +1,70 @@
+import json
+from typing import Iterable, Iterator, List, Tuple
+
+Segment = Tuple[float, float, str]
+
+MEDIA_TYPES = {
+    "srt": "application/x-subrip",
+    "vtt": "text/vtt",
+    "json": "application/json",
+    "txt": "text/plain",
+}
+
+
+def encode_segments(segments: Iterable[dict]) -> str:
+    """Pack Whisper segments into a compact JSON list of [start, end, text]."""
+    packed = [
+        [round(float(segment["start"]), 3), round(float(segment["end"]), 3), segment["text"].strip()]
+        for segment in segments
+    ]
+    return json.dumps(packed, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_segments(encoded: str) -> List[Segment]:
+    return [(start, end, text) for start, end, text in json.loads(encoded)]
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def _render_srt(segments: List[Segment]) -> Iterator[str]:
+    for index, (start, end, text) in enumerate(segments, start=1):
+        yield f"{index}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{text}\n\n"
+
+
+def _render_vtt(segments: List[Segment]) -> Iterator[str]:
+    yield "WEBVTT\n\n"
+    for start, end, text in segments:
+        yield f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n{text}\n\n"
+
+
+def _render_json(segments: List[Segment]) -> Iterator[str]:
+    yield "["
+    for index, (start, end, text) in enumerate(segments):
+        prefix = "," if index else ""
+        yield prefix + json.dumps({"start": start, "end": end, "text": text}, ensure_ascii=False)
+    yield "]"
+
+
+def _render_txt(segments: List[Segment]) -> Iterator[str]:
+    for _, _, text in segments:
+        yield text + "\n"
+
+
+RENDERERS = {
+    "srt": _render_srt,
+    "vtt": _render_vtt,
+    "json": _render_json,
+    "txt": _render_txt,
+}
+
+
+def render(segments: List[Segment], fmt: str) -> Iterator[bytes]:
+    """Yield the transcript in the requested format chunk by chunk."""
+    for chunk in RENDERERS[fmt](segments):
+        yield chunk.encode("utf-8")
@@ -1,5 +1,7 @@
+import html
 from typing import Optional
 
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from app.db import models
@@ -29,18 +31,59 @@ def get_tasks_for_user(db: Session, user_id: int):
         .all()
     )
 
-def create_task(db: Session, task_id: str, user_id: int):
-    db_task = models.Task(id=task_id, user_id=user_id)
+def get_cached_language(db: Session, user_id: int, audio_hash: str):
+    """Return the user's most recent task that already detected the language of this audio.
+
+    Scoped to the user so a cache hit never reveals that someone else uploaded the file.
+    """
+    return (
+        db.query(models.Task)
+        .filter(
+            models.Task.user_id == user_id,
+            models.Task.audio_hash == audio_hash,
+            models.Task.detected_language.isnot(None),
+        )
+        .order_by(models.Task.created_at.desc())
+        .first()
+    )
+
+def create_task(
+    db: Session,
+    task_id: str,
+    user_id: int,
+    audio_hash: Optional[str] = None,
+    detected_language: Optional[str] = None,
+    language_confidence: Optional[float] = None,
+):
+    db_task = models.Task(
+        id=task_id,
+        user_id=user_id,
+        audio_hash=audio_hash,
+        detected_language=detected_language,
+        language_confidence=language_confidence,
+    )
     db.add(db_task)
     db.commit()
     db.refresh(db_task)
     return db_task
 
-def update_task_status(db: Session, task_id: str, status: models.TaskStatus, result: str = None):
+def update_task_status(
+    db: Session, task_id: str, status: models.TaskStatus, result: str = None, segments: str = None
+):
     db_task = get_task(db, task_id)
     if db_task:
         db_task.status = status
         db_task.result = result
+        db_task.segments = segments
+        db.commit()
+        db.refresh(db_task)
+    return db_task
+
+def update_task_language(db: Session, task_id: str, language: str, confidence: float):
+    db_task = get_task(db, task_id)
+    if db_task:
+        db_task.detected_language = language
+        db_task.language_confidence = confidence
         db.commit()
         db.refresh(db_task)
     return db_task
@@ -54,6 +97,114 @@ def delete_task(db: Session, task_id: str, user_id: int):
     if not task:
         return False
 
+    db.execute(text("DELETE FROM task_search WHERE task_id = :task_id"), {"task_id": task_id})
     db.delete(task)
     db.commit()
     return True
+
+
+def _fts5_query(query: str) -> str:
+    """Quote each term so user input is matched literally instead of as FTS5 syntax."""
+    terms = query.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def index_task_result(db: Session, task_id: str, user_id: int, content: str):
+    params = {"task_id": task_id, "user_id": user_id, "content": content}
+    db.execute(text("DELETE FROM task_search WHERE task_id = :task_id"), params)
+    if db.bind.dialect.name == "sqlite":
+        db.execute(
+            text(
+                "INSERT INTO task_search (task_id, user_id, content) "
+                "VALUES (:task_id, :user_id, :content)"
+            ),
+            params,
+        )
+    else:
+        db.execute(
+            text(
+                "INSERT INTO task_search (task_id, user_id, content, document) "
+                "VALUES (:task_id, :user_id, :content, to_tsvector('simple', :content))"
+            ),
+            params,
+        )
+    db.commit()
+
+
+# Private-use code points stand in for the highlight tags until the snippet is escaped
+_HIGHLIGHT_START = "\ue000"
+_HIGHLIGHT_STOP = "\ue001"
+
+
+def _highlight(snippet: str) -> str:
+    """HTML-escape transcript text, keeping only the <mark> tags added for matches."""
+    escaped = html.escape(snippet or "", quote=False)
+    return escaped.replace(_HIGHLIGHT_START, "<mark>").replace(_HIGHLIGHT_STOP, "</mark>")
+
+
+def _search_sql(db: Session, query: str):
+    """Return the FROM/WHERE clause and parameters matching the user's transcripts."""
+    if db.bind.dialect.name == "sqlite":
+        clause = (
+            "FROM task_search JOIN tasks t ON t.id = task_search.task_id "
+            "WHERE task_search MATCH :query AND t.user_id = :user_id"
+        )
+        return clause, {"query": _fts5_query(query)}
+
+    clause = (
+        "FROM task_search s JOIN tasks t ON t.id = s.task_id, "
+        "plainto_tsquery('simple', :query) q "
+        "WHERE s.document @@ q AND t.user_id = :user_id"
+    )
+    return clause, {"query": query}
+
+
+def count_search_results(db: Session, user_id: int, query: str) -> int:
+    if not query.split():
+        return 0
+
+    clause, params = _search_sql(db, query)
+    params["user_id"] = user_id
+    return db.execute(text(f"SELECT count(*) {clause}"), params).scalar_one()
+
+
+def search_tasks(db: Session, user_id: int, query: str, limit: int = 20, offset: int = 0):
+    """Return ranked transcript matches owned by the user, best first, with snippets.
+
+    Snippets are HTML-escaped with matches wrapped in <mark> tags.
+    """
+    if not query.split():
+        return []
+
+    clause, params = _search_sql(db, query)
+    if db.bind.dialect.name == "sqlite":
+        columns = (
+            "snippet(task_search, 2, :start_sel, :stop_sel, '…', 16) AS snippet, "
+            "bm25(task_search) AS rank"
+        )
+        order = "rank"
+    else:
+        columns = (
+            "ts_headline('simple', s.content, q, "
+            "'StartSel=' || :start_sel || ', StopSel=' || :stop_sel || ', MaxWords=16, MinWords=8') AS snippet, "
+            "ts_rank(s.document, q) AS rank"
+        )
+        order = "rank DESC"
+
+    statement = text(
+        f"SELECT t.id, t.status, t.created_at, {columns} {clause} "
+        f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+    )
+    params.update(
+        {
+            "user_id": user_id,
+            "limit": limit,
+            "offset": offset,
+            "start_sel": _HIGHLIGHT_START,
+            "stop_sel": _HIGHLIGHT_STOP,
+        }
+    )
+    return [
+        {**match, "snippet": _highlight(match["snippet"])}
+        for match in db.execute(statement, params).mappings().all()
+    ]
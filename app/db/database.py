@@ -8,24 +8,86 @@ engine = create_engine(settings.DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def ensure_created_at_column():
-    """Ensure tasks table has a created_at column for ordering."""
+def _ensure_column(table: str, column: str, sqlite_type: str, postgres_type: str):
+    """Add a column to an existing table created before the column was introduced."""
     inspector = inspect(engine)
-    if not inspector.has_table("tasks"):
+    if not inspector.has_table(table):
         return
 
-    column_names = {column["name"] for column in inspector.get_columns("tasks")}
-    if "created_at" in column_names:
+    column_names = {existing["name"] for existing in inspector.get_columns(table)}
+    if column in column_names:
         return
 
-    ddl = (
-        "ALTER TABLE tasks ADD COLUMN created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)"
-        if engine.dialect.name == "sqlite"
-        else "ALTER TABLE tasks ADD COLUMN created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()"
+    column_type = sqlite_type if engine.dialect.name == "sqlite" else postgres_type
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+
+
+def ensure_created_at_column():
+    """Ensure tasks table has a created_at column for ordering."""
+    _ensure_column(
+        "tasks",
+        "created_at",
+        "DATETIME DEFAULT (CURRENT_TIMESTAMP)",
+        "TIMESTAMP WITH TIME ZONE DEFAULT NOW()",
     )
 
+
+def ensure_segments_column():
+    """Ensure tasks table can store timestamped transcript segments."""
+    _ensure_column("tasks", "segments", "TEXT", "TEXT")
+
+
+def ensure_language_columns():
+    """Ensure tasks table can cache language detection per audio hash."""
+    _ensure_column("tasks", "audio_hash", "VARCHAR", "VARCHAR")
+    _ensure_column("tasks", "detected_language", "VARCHAR", "VARCHAR")
+    _ensure_column("tasks", "language_confidence", "FLOAT", "DOUBLE PRECISION")
+
+    with engine.begin() as connection:
+        connection.execute(
+            text("CREATE INDEX IF NOT EXISTS ix_tasks_audio_hash ON tasks (audio_hash)")
+        )
+
+
+def ensure_search_index():
+    """Create the full-text index over transcripts for the active dialect.
+
+    When the index is created for the first time, transcripts that already exist
+    are backfilled so history recorded before search was added is searchable.
+    """
+    if engine.dialect.name == "sqlite":
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5("
+            "task_id UNINDEXED, user_id UNINDEXED, content, tokenize='unicode61')",
+        ]
+        backfill = (
+            "INSERT INTO task_search (task_id, user_id, content) "
+            "SELECT id, user_id, result FROM tasks "
+            "WHERE status = 'SUCCESS' AND result IS NOT NULL"
+        )
+    else:
+        statements = [
+            "CREATE TABLE IF NOT EXISTS task_search ("
+            "task_id VARCHAR PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE, "
+            "user_id INTEGER NOT NULL, "
+            "content TEXT NOT NULL, "
+            "document TSVECTOR NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_task_search_document ON task_search USING GIN (document)",
+            "CREATE INDEX IF NOT EXISTS ix_task_search_user_id ON task_search (user_id)",
+        ]
+        backfill = (
+            "INSERT INTO task_search (task_id, user_id, content, document) "
+            "SELECT id, user_id, result, to_tsvector('simple', result) FROM tasks "
+            "WHERE status = 'SUCCESS' AND result IS NOT NULL"
+        )
+
+    created = not inspect(engine).has_table("task_search")
     with engine.begin() as connection:
-        connection.execute(text(ddl))
+        for ddl in statements:
+            connection.execute(text(ddl))
+        if created:
+            connection.execute(text(backfill))
 
 
 def init_db():
@@ -34,3 +96,6 @@ def init_db():
 
     models.Base.metadata.create_all(bind=engine)
     ensure_created_at_column()
+    ensure_segments_column()
+    ensure_language_columns()
+    ensure_search_index()
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, func
+from sqlalchemy import Column, Float, Integer, String, Text, Enum, ForeignKey, DateTime, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -29,6 +29,11 @@ class Task(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     status = Column(Enum(TaskStatus), default=TaskStatus.PENDING)
     result = Column(String, nullable=True)
+    # Compact JSON list of [start, end, text] triples, see app.core.transcripts
+    segments = Column(Text, nullable=True)
+    audio_hash = Column(String, nullable=True, index=True)
+    detected_language = Column(String, nullable=True)
+    language_confidence = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     owner = relationship("User", back_populates="tasks")
@@ -20,6 +20,8 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_always_eager=os.environ.get("CELERY_TASK_ALWAYS_EAGER", "false").lower() == "true",
+    # Short language-detection jobs get their own queue so they never wait behind transcriptions
+    task_routes={"detect_language_task": {"queue": "detection"}},
     task_eager_propagates=os.environ.get("CELERY_TASK_EAGER_PROPAGATES", "true").lower() == "true",
 )
 
@@ -1,28 +1,115 @@
+import logging
 import os
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional, Tuple
 
 from app.worker.celery_app import celery_app
 from app.db.database import SessionLocal
 from app.db import crud, models
+from app.core import admission
+from app.core.transcripts import encode_segments
+
+logger = logging.getLogger(__name__)
 
 USE_FAKE_TRANSCRIPTION = os.environ.get("USE_FAKE_TRANSCRIPTION", "false").lower() == "true"
 WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
+# Multilingual model used only to identify the language from the first 30 seconds
+WHISPER_DETECT_MODEL = os.environ.get("WHISPER_DETECT_MODEL", "tiny")
+# Switch to the faster English-only variant (e.g. base.en) when audio is English
+WHISPER_PREFER_ENGLISH_MODEL = os.environ.get("WHISPER_PREFER_ENGLISH_MODEL", "true").lower() == "true"
+ENGLISH_ONLY_MODELS = {"tiny", "base", "small", "medium"}
+# Below this confidence "auto" requests are left for the main model to detect on its own
+LANGUAGE_PIN_CONFIDENCE = float(os.environ.get("LANGUAGE_PIN_CONFIDENCE", "0.8"))
+# Models kept loaded per worker process: the detection model, WHISPER_MODEL and its
+# .en variant. Each costs its full weights in memory (roughly 1.5 GB for medium)
+# times the worker concurrency; lower it to trade reloads for memory, 0 reloads every task.
+WHISPER_MODEL_CACHE_SIZE = int(os.environ.get("WHISPER_MODEL_CACHE_SIZE", "3"))
+DETECTION_SECONDS = 30
+
+
+@lru_cache(maxsize=WHISPER_MODEL_CACHE_SIZE)
+def _load_model(name: str):
+    import whisper  # Imported lazily to avoid heavy startup when faked
+
+    return whisper.load_model(name)
+
+
+def _model_for_language(language: str) -> str:
+    if WHISPER_PREFER_ENGLISH_MODEL and language == "en" and WHISPER_MODEL in ENGLISH_ONLY_MODELS:
+        return f"{WHISPER_MODEL}.en"
+    return WHISPER_MODEL
 
 
-def _transcribe_audio(file_path: Path, language: str) -> str:
-    """Transcribe audio with Whisper or fall back to a lightweight stub in tests."""
+def _detect_language(file_path: Path) -> Optional[Tuple[str, float]]:
+    """Identify the spoken language from the first 30 seconds of audio."""
     if USE_FAKE_TRANSCRIPTION:
-        return f"Transcription placeholder for {file_path.name}"
+        return "en", 1.0
+
+    import ffmpeg
+    import numpy as np
+    import whisper
+
+    model = _load_model(WHISPER_DETECT_MODEL)
+    if not model.is_multilingual:
+        return None
+
+    try:
+        # Decode only the window Whisper looks at instead of the whole upload
+        out, _ = (
+            ffmpeg.input(str(file_path), t=DETECTION_SECONDS, threads=0)
+            .output("-", format="s16le", acodec="pcm_s16le", ac=1, ar=whisper.audio.SAMPLE_RATE)
+            .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error:
+        logger.warning("Could not decode %s for language detection", file_path.name)
+        return None
+
+    audio = whisper.pad_or_trim(np.frombuffer(out, np.int16).astype(np.float32) / 32768.0)
+    mel = whisper.log_mel_spectrogram(audio, n_mels=model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    language = max(probs, key=probs.get)
+    return language, float(probs[language])
 
-    import whisper  # Imported lazily to avoid heavy startup when faked
 
-    model = whisper.load_model(WHISPER_MODEL)
+def _transcribe_audio(file_path: Path, language: str) -> Tuple[str, str]:
+    """Transcribe audio with Whisper or fall back to a lightweight stub in tests.
+
+    Returns the plain text and the encoded timestamped segments.
+    """
+    if USE_FAKE_TRANSCRIPTION:
+        text = f"Transcription placeholder for {file_path.name}"
+        return text, encode_segments([{"start": 0.0, "end": 1.0, "text": text}])
+
+    model = _load_model(_model_for_language(language))
     options = {} if language == "auto" else {"language": language}
     result = model.transcribe(str(file_path), **options)
     text = result.get("text", "").strip()
     if not text:
         raise RuntimeError("Transcription failed: empty result")
-    return text
+    return text, encode_segments(result.get("segments", []))
+
+
+@celery_app.task(name="detect_language_task")
+def detect_language_task(task_id: str, file_path: str):
+    """Identify the language up front so /status reports it while transcription waits."""
+    db = SessionLocal()
+    path = Path(file_path)
+    try:
+        if not path.exists():
+            # Transcription already finished and removed the upload
+            return None
+        detection = _detect_language(path)
+        if detection:
+            crud.update_task_language(db, task_id, *detection)
+        return detection
+    except Exception:
+        # Detection is an optimisation; it must never affect the transcription itself
+        db.rollback()
+        logger.exception("Language detection failed for task %s", task_id)
+        return None
+    finally:
+        db.close()
 
 
 @celery_app.task(name="transcribe_task")
@@ -30,12 +117,31 @@ def transcribe_task(task_id: str, language: str, file_path: str):
     db = SessionLocal()
     path = Path(file_path)
     try:
-        crud.update_task_status(db, task_id, models.TaskStatus.PROCESSING)
+        task = crud.update_task_status(db, task_id, models.TaskStatus.PROCESSING)
         if not path.exists():
             raise FileNotFoundError(f"Uploaded file not found at {file_path}")
 
-        transcription = _transcribe_audio(path, language)
-        crud.update_task_status(db, task_id, models.TaskStatus.SUCCESS, result=transcription)
+        # Detection runs as its own task on the detection queue; when it has
+        # finished by now, a confident guess saves the main model a second pass
+        if (
+            language == "auto"
+            and task
+            and task.detected_language
+            and (task.language_confidence or 0) >= LANGUAGE_PIN_CONFIDENCE
+        ):
+            language = task.detected_language
+
+        transcription, segments = _transcribe_audio(path, language)
+        task = crud.update_task_status(
+            db, task_id, models.TaskStatus.SUCCESS, result=transcription, segments=segments
+        )
+        if task:
+            try:
+                crud.index_task_result(db, task_id, task.user_id, transcription)
+            except Exception:
+                # The transcript is already saved; a missing search entry must not fail the task
+                db.rollback()
+                logger.exception("Failed to index transcript for task %s", task_id)
         return transcription
     except RuntimeError as e:
         # Expected failures (e.g., empty transcription) are recorded but not re-raised to avoid noisy Celery errors
@@ -47,6 +153,7 @@ def transcribe_task(task_id: str, language: str, file_path: str):
     finally:
         if path.exists():
             path.unlink(missing_ok=True)
+        admission.release(task_id)
         db.close()
 
 
@@ -1,8 +1,18 @@
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import pytest
 from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import text
 
+from app.core import admission, security
+from app.core.config import settings
+from app.db import crud
+from app.db.database import SessionLocal, engine, ensure_search_index
 from app.main import app
+from app.worker import tasks
+from app.worker.celery_app import celery_app
 
 client = TestClient(app)
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -102,3 +112,404 @@ def test_cannot_read_other_users_task():
 
     forbidden = client.get(f"/api/status/{task_id}", headers=auth_headers(bob))
     assert forbidden.status_code == 403
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the Redis commands admission control uses."""
+
+    def __init__(self, queue_depth: int = 0):
+        self.values = {}
+        self.hashes = {}
+        self.sorted_sets = {}
+        self.queue_depth = queue_depth
+
+    def llen(self, name):
+        return self.queue_depth
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def expire(self, key, seconds):
+        return True
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def hvals(self, key):
+        return list(self.hashes.get(key, {}).values())
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.sorted_sets.get(key, {}).pop(member, None)
+
+    def zremrangebyscore(self, key, minimum, maximum):
+        expired = [member for member, score in self.sorted_sets.get(key, {}).items() if score <= maximum]
+        self.zrem(key, *expired)
+
+    def zrange(self, key, start, end):
+        return list(self.sorted_sets.get(key, {}))
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them back to back, like MULTI/EXEC on one connection."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+
+        return queue
+
+    def execute(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+def use_fake_redis(monkeypatch, fake):
+    monkeypatch.setattr(admission, "get_redis", lambda: fake)
+    monkeypatch.setattr(admission, "get_broker_redis", lambda: fake)
+
+
+def submit(token: str):
+    with TEST_AUDIO.open("rb") as audio:
+        return client.post(
+            "/api/transcribe",
+            data={"language": "auto"},
+            files={"file": ("test.wav", audio, "audio/wav")},
+            headers=auth_headers(token),
+        )
+
+
+def test_transcribe_returns_estimated_completion_and_releases_backlog(monkeypatch):
+    fake = FakeRedis()
+    use_fake_redis(monkeypatch, fake)
+    token = register("dave@example.com", "secret").json()["access_token"]
+
+    response = submit(token)
+    assert response.status_code == 200
+    assert response.json()["estimated_completion_at"]
+    assert fake.hvals(admission.RESERVED_SECONDS_KEY) == []
+
+
+def test_transcribe_rejects_when_queue_is_full(monkeypatch):
+    use_fake_redis(monkeypatch, FakeRedis(queue_depth=1000))
+    token = register("erin@example.com", "secret").json()["access_token"]
+
+    response = submit(token)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_backlog_reservation_is_rolled_back_when_over_limit(monkeypatch):
+    fake = FakeRedis()
+    use_fake_redis(monkeypatch, fake)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_BACKLOG_SECONDS", 10)
+
+    admission.admit("first", 6)
+    with pytest.raises(admission.AdmissionRejected) as exc_info:
+        admission.admit("second", 6)
+    assert exc_info.value.status_code == 503
+    assert fake.hvals(admission.RESERVED_SECONDS_KEY) == [6]
+
+
+def test_queue_full_retry_after_reflects_backlog_not_upload(monkeypatch):
+    fake = FakeRedis()
+    use_fake_redis(monkeypatch, fake)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE_DEPTH", 1)
+    admission.admit("queued", 600)
+    fake.queue_depth = 1
+
+    with pytest.raises(admission.AdmissionRejected) as exc_info:
+        admission.admit("short", 1)
+    assert exc_info.value.retry_after == 600
+
+
+def test_estimated_completion_is_timezone_aware():
+    assert admission.admit("task", 1).estimated_completion_at.tzinfo is not None
+
+
+def test_expired_reservations_no_longer_count_towards_backlog(monkeypatch):
+    fake = FakeRedis()
+    use_fake_redis(monkeypatch, fake)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_BACKLOG_SECONDS", 10)
+    monkeypatch.setattr(settings, "ADMISSION_RESERVATION_TTL_SECONDS", -1)
+
+    # The first reservation expires immediately, as if its worker had been killed
+    admission.admit("lost", 6)
+    assert admission.admit("next", 6).backlog_seconds == 0
+
+
+def test_transcribe_enforces_per_user_rate_limit(monkeypatch):
+    fake = FakeRedis()
+    use_fake_redis(monkeypatch, fake)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_MINUTE", 1)
+    token = register("frank@example.com", "secret").json()["access_token"]
+
+    assert submit(token).status_code == 200
+    limited = submit(token)
+    assert limited.status_code == 429
+    assert "Retry-After" in limited.headers
+
+
+def test_search_returns_ranked_snippets_scoped_to_user():
+    alice = register("alice@example.com", "secret").json()["access_token"]
+    bob = register("bob@example.com", "secret").json()["access_token"]
+    task_id = submit(alice).json()["task_id"]
+
+    response = client.get("/api/tasks/search", params={"q": "placeholder"}, headers=auth_headers(alice))
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == [task_id]
+    assert "<mark>placeholder</mark>" in items[0]["snippet"].lower()
+
+    other = client.get("/api/tasks/search", params={"q": "placeholder"}, headers=auth_headers(bob))
+    assert other.json()["items"] == []
+
+
+def test_search_treats_query_syntax_literally():
+    token = register("carol@example.com", "secret").json()["access_token"]
+    submit(token)
+
+    response = client.get("/api/tasks/search", params={"q": 'placeholder" OR ('}, headers=auth_headers(token))
+    assert response.status_code == 200
+
+
+def test_transcript_renders_subtitle_formats():
+    token = register("grace@example.com", "secret").json()["access_token"]
+    task_id = submit(token).json()["task_id"]
+
+    srt = client.get(f"/api/tasks/{task_id}/transcript", params={"format": "srt"}, headers=auth_headers(token))
+    assert srt.status_code == 200
+    assert srt.text.startswith("1\n00:00:00,000 --> 00:00:01,000\nTranscription placeholder")
+
+    vtt = client.get(f"/api/tasks/{task_id}/transcript", params={"format": "vtt"}, headers=auth_headers(token))
+    assert vtt.text.startswith("WEBVTT\n\n00:00:00.000 --> 00:00:01.000\n")
+
+    as_json = client.get(f"/api/tasks/{task_id}/transcript", params={"format": "json"}, headers=auth_headers(token))
+    assert as_json.json()[0]["end"] == 1.0
+
+
+def test_transcript_supports_conditional_get():
+    token = register("heidi@example.com", "secret").json()["access_token"]
+    task_id = submit(token).json()["task_id"]
+    url = f"/api/tasks/{task_id}/transcript"
+
+    first = client.get(url, headers=auth_headers(token))
+    etag = first.headers["ETag"]
+
+    cached = client.get(url, headers={**auth_headers(token), "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    for header in (f'"other", W/{etag}', "*"):
+        revalidated = client.get(url, headers={**auth_headers(token), "If-None-Match": header})
+        assert revalidated.status_code == 304
+
+    changed = client.get(url, headers={**auth_headers(token), "If-None-Match": '"other"'})
+    assert changed.status_code == 200
+
+
+def test_token_embeds_user_id_and_key_id():
+    token = register("ivan@example.com", "secret").json()["access_token"]
+
+    assert jwt.get_unverified_header(token)["kid"] == settings.SIGNING_KEY_ID
+    assert security.decode_access_token(token)["uid"]
+    assert client.get("/api/tasks", headers=auth_headers(token)).status_code == 200
+
+
+def test_tokens_from_previous_signing_key_remain_valid_after_rotation(monkeypatch):
+    token = register("judy@example.com", "secret").json()["access_token"]
+    security.token_cache.clear()
+
+    monkeypatch.setattr(settings, "SIGNING_KEYS", f"{settings.SIGNING_KEY_ID}:{settings.SECRET_KEY},next:rotated-secret")
+    monkeypatch.setattr(settings, "SIGNING_KEY_ID", "next")
+    security.get_signing_keys.cache_clear()
+    try:
+        assert client.get("/api/tasks", headers=auth_headers(token)).status_code == 200
+        rotated = login("judy@example.com", "secret").json()["access_token"]
+        assert jwt.get_unverified_header(rotated)["kid"] == "next"
+        assert client.get("/api/tasks", headers=auth_headers(rotated)).status_code == 200
+    finally:
+        security.get_signing_keys.cache_clear()
+
+
+def test_legacy_token_without_key_id_or_user_id_is_accepted():
+    register("mallory@example.com", "secret")
+    legacy = jwt.encode(
+        {"exp": datetime.utcnow() + timedelta(minutes=5), "sub": "mallory@example.com"},
+        settings.SECRET_KEY,
+        algorithm=security.ALGORITHM,
+    )
+
+    assert client.get("/api/tasks", headers=auth_headers(legacy)).status_code == 200
+
+
+def test_legacy_token_user_id_claim_is_ignored():
+    alice = register("alice@example.com", "secret").json()["access_token"]
+    alice_id = security.decode_access_token(alice)["uid"]
+    register("bob@example.com", "secret")
+    task_id = submit(alice).json()["task_id"]
+
+    forged = jwt.encode(
+        {"exp": datetime.utcnow() + timedelta(minutes=5), "sub": "bob@example.com", "uid": alice_id},
+        settings.SECRET_KEY,
+        algorithm=security.ALGORITHM,
+    )
+
+    assert client.get(f"/api/status/{task_id}", headers=auth_headers(forged)).status_code == 403
+
+
+def test_token_without_key_id_is_rejected_once_secret_key_is_retired(monkeypatch):
+    register("trent@example.com", "secret")
+    legacy = jwt.encode(
+        {"exp": datetime.utcnow() + timedelta(minutes=5), "sub": "trent@example.com", "uid": 1},
+        settings.SECRET_KEY,
+        algorithm=security.ALGORITHM,
+    )
+    security.token_cache.clear()
+
+    monkeypatch.setattr(settings, "SIGNING_KEYS", "k2:new-secret")
+    monkeypatch.setattr(settings, "SIGNING_KEY_ID", "k2")
+    security.get_signing_keys.cache_clear()
+    try:
+        assert client.get("/api/tasks", headers=auth_headers(legacy)).status_code == 401
+    finally:
+        security.get_signing_keys.cache_clear()
+
+
+def test_token_with_unknown_key_id_is_rejected():
+    forged = jwt.encode(
+        {"exp": datetime.utcnow() + timedelta(minutes=5), "sub": "x@example.com", "uid": 1},
+        "not-our-secret",
+        algorithm=security.ALGORITHM,
+        headers={"kid": "unknown"},
+    )
+
+    assert client.get("/api/tasks", headers=auth_headers(forged)).status_code == 401
+
+
+def test_status_reports_detected_language_and_reuses_it_for_same_audio(monkeypatch):
+    calls = []
+    original = tasks._detect_language
+    monkeypatch.setattr(tasks, "_detect_language", lambda path: calls.append(path) or original(path))
+    token = register("nina@example.com", "secret").json()["access_token"]
+
+    first = submit(token).json()["task_id"]
+    second = submit(token).json()["task_id"]
+
+    for task_id in (first, second):
+        payload = client.get(f"/api/status/{task_id}", headers=auth_headers(token)).json()
+        assert payload["detected_language"] == "en"
+        assert payload["language_confidence"] == 1.0
+    assert len(calls) == 1
+
+
+def test_search_index_failure_keeps_successful_task(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("fts write failed")
+
+    monkeypatch.setattr(tasks.crud, "index_task_result", fail)
+    token = register("oscar@example.com", "secret").json()["access_token"]
+    task_id = submit(token).json()["task_id"]
+
+    payload = client.get(f"/api/status/{task_id}", headers=auth_headers(token)).json()
+    assert payload["status"] == "SUCCESS"
+    transcript = client.get(f"/api/tasks/{task_id}/transcript", params={"format": "srt"}, headers=auth_headers(token))
+    assert transcript.status_code == 200
+
+
+def test_search_index_is_backfilled_from_existing_transcripts():
+    token = register("peggy@example.com", "secret").json()["access_token"]
+    task_id = submit(token).json()["task_id"]
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE task_search"))
+    ensure_search_index()
+
+    response = client.get("/api/tasks/search", params={"q": "placeholder"}, headers=auth_headers(token))
+    assert [item["id"] for item in response.json()["items"]] == [task_id]
+
+
+def test_language_cache_is_not_shared_between_users(monkeypatch):
+    calls = []
+    original = tasks._detect_language
+    monkeypatch.setattr(tasks, "_detect_language", lambda path: calls.append(path) or original(path))
+    alice = register("alice@example.com", "secret").json()["access_token"]
+    bob = register("bob@example.com", "secret").json()["access_token"]
+
+    submit(alice)
+    submit(bob)
+    assert len(calls) == 2
+
+
+def test_low_confidence_detection_keeps_auto(monkeypatch):
+    languages = []
+    original = tasks._transcribe_audio
+    monkeypatch.setattr(tasks, "_detect_language", lambda path: ("en", 0.3))
+    monkeypatch.setattr(tasks, "_transcribe_audio", lambda path, language: languages.append(language) or original(path, language))
+    token = register("quinn@example.com", "secret").json()["access_token"]
+
+    task_id = submit(token).json()["task_id"]
+    assert languages == ["auto"]
+    payload = client.get(f"/api/status/{task_id}", headers=auth_headers(token)).json()
+    assert payload["detected_language"] == "en"
+    assert payload["language_confidence"] == 0.3
+
+
+def test_search_snippets_escape_transcript_markup_and_report_total():
+    token = register("rupert@example.com", "secret").json()["access_token"]
+    task_ids = [submit(token).json()["task_id"] for _ in range(2)]
+    db = SessionLocal()
+    try:
+        user_id = crud.get_task(db, task_ids[0]).user_id
+        crud.index_task_result(db, task_ids[0], user_id, "<script>alert(1)</script> placeholder")
+    finally:
+        db.close()
+
+    response = client.get(
+        "/api/tasks/search", params={"q": "placeholder", "limit": 1}, headers=auth_headers(token)
+    ).json()
+    assert response["total"] == 2
+    assert response["has_more"] is True
+
+    page = client.get(
+        "/api/tasks/search", params={"q": "alert placeholder"}, headers=auth_headers(token)
+    ).json()
+    snippet = page["items"][0]["snippet"]
+    assert "<script>" not in snippet
+    assert "&lt;script&gt;" in snippet
+    assert "<mark>placeholder</mark>" in snippet
+    assert page["has_more"] is False
+
+
+def test_language_detection_failure_does_not_fail_transcription(monkeypatch):
+    def fail(path):
+        raise RuntimeError("detection model unavailable")
+
+    monkeypatch.setattr(tasks, "_detect_language", fail)
+    token = register("sybil@example.com", "secret").json()["access_token"]
+    task_id = submit(token).json()["task_id"]
+
+    payload = client.get(f"/api/status/{task_id}", headers=auth_headers(token)).json()
+    assert payload["status"] == "SUCCESS"
+    assert payload["detected_language"] is None
+
+
+def test_language_detection_runs_on_its_own_queue():
+    assert celery_app.amqp.router.route({}, "detect_language_task")["queue"].name == "detection"